@@ -0,0 +1,419 @@
+import os
+import io
+import sys
+import json
+import base64
+import random
+import shutil
+import struct
+import argparse
+import tempfile
+
+import numpy as np
+from PIL import Image
+from time import time
+from colorama import init, Fore, Style
+import terminaltables
+
+import datamine
+
+# Benchmarks datamine.py on synthetic game files, no game dump needed
+# Run "python benchmark.py" to time a run and compare it to the baseline
+# Add "--save-baseline" to make the results the new baseline
+
+BASELINE = "benchmark_baseline.json"
+RESULTS = "benchmark_results.json"
+
+# Sizes of the synthetic versions, all can be changed from the command line
+DEFAULTS = {
+    'textures': 200,          # ui textures, most with an alpha mask
+    'texture_size': 128,
+    'tables': 20,             # base64 UTF-16 CSV TextAssets
+    'rows': 2000,
+    'maps': 50,               # map TextAssets
+    'map_objects': 100,
+    'skills': 5000,           # HERO_SKILL records
+    'strings': 20000,         # strings per locale
+    'locales': 3,
+    'newcontents': 10,        # NewContents banners
+    'changed': 0.05           # share of everything edited between versions
+}
+LOCALES = ['en', 'fr', 'de', 'es', 'it', 'ja', 'ko', 'pt', 'ru', 'zh']
+
+# Unity version written into every serialized file header
+UNITY = "2020.3.0f1"
+
+
+# Typetrees are flat lists of (level, type, name, flags) nodes.
+# 0x4000 on a node aligns the stream to 4 bytes after it
+def string_node(level, name):
+    return [(level, 'string', name, 0x8000), (level + 1, 'Array', 'Array', 0x4001),
+            (level + 2, 'int', 'size', 1), (level + 2, 'char', 'data', 1)]
+
+
+TEXTURE2D = [(0, 'Texture2D', 'Base', 0x8000)] + string_node(1, 'm_Name') + [
+    (1, 'int', 'm_ForcedFallbackFormat', 0), (1, 'bool', 'm_DownscaleFallback', 0),
+    (1, 'bool', 'm_IsAlphaChannelOptional', 0x4000),
+    (1, 'int', 'm_Width', 0), (1, 'int', 'm_Height', 0),
+    (1, 'unsigned int', 'm_CompleteImageSize', 0), (1, 'int', 'm_MipsStripped', 0),
+    (1, 'int', 'm_TextureFormat', 0), (1, 'int', 'm_MipCount', 0),
+    (1, 'bool', 'm_IsReadable', 0), (1, 'bool', 'm_IsPreProcessed', 0),
+    (1, 'bool', 'm_IgnoreMasterTextureLimit', 0), (1, 'bool', 'm_StreamingMipmaps', 0x4000),
+    (1, 'int', 'm_StreamingMipmapsPriority', 0), (1, 'int', 'm_ImageCount', 0),
+    (1, 'int', 'm_TextureDimension', 0),
+    (1, 'GLTextureSettings', 'm_TextureSettings', 0),
+    (2, 'int', 'm_FilterMode', 0), (2, 'int', 'm_Aniso', 0), (2, 'float', 'm_MipBias', 0),
+    (2, 'int', 'm_WrapU', 0), (2, 'int', 'm_WrapV', 0), (2, 'int', 'm_WrapW', 0),
+    (1, 'int', 'm_LightmapFormat', 0), (1, 'int', 'm_ColorSpace', 0),
+    (1, 'vector', 'm_PlatformBlob', 0x8000), (2, 'Array', 'Array', 0x4000),
+    (3, 'int', 'size', 0), (3, 'UInt8', 'data', 0),
+    (1, 'TypelessData', 'image data', 0x4001), (2, 'int', 'size', 1), (2, 'UInt8', 'data', 1),
+    (1, 'StreamingInfo', 'm_StreamData', 0x8000),
+    (2, 'UInt64', 'offset', 0), (2, 'unsigned int', 'size', 0)] + string_node(2, 'path')
+
+TEXTASSET = [(0, 'TextAsset', 'Base', 0x8000)] + string_node(1, 'm_Name') + string_node(1, 'm_Script')
+
+MONOBEHAVIOUR = [
+    (0, 'MonoBehaviour', 'Base', 0x8000),
+    (1, 'PPtr<GameObject>', 'm_GameObject', 0), (2, 'int', 'm_FileID', 0), (2, 'SInt64', 'm_PathID', 0),
+    (1, 'UInt8', 'm_Enabled', 0x4000),
+    (1, 'PPtr<MonoScript>', 'm_Script', 0), (2, 'int', 'm_FileID', 0), (2, 'SInt64', 'm_PathID', 0),
+] + string_node(1, 'm_Name')
+
+HERO_SKILL = MONOBEHAVIOUR + [
+    (1, 'vector', 'values', 0x8000), (2, 'Array', 'Array', 0x4000), (3, 'int', 'size', 0),
+    (3, 'Skill', 'data', 0), (4, 'int', 'id', 0), (4, 'int', 'heroGroupId', 0),
+    (4, 'int', 'ultimateSkillGauge', 0), (4, 'int', 'dangerSkillGauge', 0)] + string_node(4, 'desc')
+
+LOCALIZATION = MONOBEHAVIOUR + [
+    (1, 'Table', 'valueTable', 0),
+    (2, 'vector', 'keys', 0x8000), (3, 'Array', 'Array', 0x4000), (4, 'int', 'size', 0)
+] + string_node(4, 'data') + [
+    (2, 'vector', 'values', 0x8000), (3, 'Array', 'Array', 0x4000), (4, 'int', 'size', 0)
+] + string_node(4, 'data')
+
+SCALARS = {
+    'int': '<i', 'unsigned int': '<I', 'SInt64': '<q', 'UInt64': '<Q', 'float': '<f',
+    'bool': '<?', 'UInt8': '<B', 'char': '<B'
+}
+
+
+def node_tree(flat):
+    """Nest a flat typetree into (type, name, flags, children)"""
+
+    root = []
+    stack = [(-1, root)]
+    for level, kind, name, flags in flat:
+        node = (kind, name, flags, [])
+        while stack[-1][0] >= level:
+            stack.pop()
+        stack[-1][1].append(node)
+        stack.append((level, node[3]))
+    return root[0]
+
+
+def type_blob(flat):
+    """Serialize a typetree in the Unity 2019+ blob format"""
+
+    strings = io.BytesIO()
+    offsets = {}
+    nodes = io.BytesIO()
+    for i, (level, kind, name, flags) in enumerate(flat):
+        for s in (kind, name):
+            if s not in offsets:
+                offsets[s] = strings.tell()
+                strings.write(s.encode() + b'\0')
+        nodes.write(struct.pack('<hBBIIiiiQ', 1, level, kind == 'Array',
+                                offsets[kind], offsets[name], -1, i, flags, 0))
+    return struct.pack('<ii', len(flat), strings.tell()) + nodes.getvalue() + strings.getvalue()
+
+
+def write_value(out, node, value):
+    """Serialize a value following its typetree node"""
+
+    kind, name, flags, children = node
+    if kind in SCALARS:
+        out.write(struct.pack(SCALARS[kind], value))
+    elif kind == 'string':
+        raw = value.encode('utf8')
+        out.write(struct.pack('<i', len(raw)) + raw)
+        flags |= 0x4000
+    elif kind == 'TypelessData':
+        out.write(struct.pack('<i', len(value)) + value)
+    elif children and children[0][0] == 'Array':
+        flags |= children[0][2] & 0x4000
+        out.write(struct.pack('<i', len(value)))
+        for item in value:
+            write_value(out, children[0][3][1], item)
+    else:
+        for child in children:
+            write_value(out, child, value[child[1]])
+    if flags & 0x4000:
+        out.write(b'\0' * (-out.tell() % 4))
+
+
+def serialized_file(objects):
+    """Build a SerializedFile UnityPy can load from (class id, typetree, value)"""
+
+    types = []
+    type_index = {}
+    for class_id, flat, value in objects:
+        if id(flat) not in type_index:
+            type_index[id(flat)] = len(types)
+            types.append((class_id, flat))
+
+    meta = io.BytesIO()
+    meta.write(UNITY.encode() + b'\0')
+    meta.write(struct.pack('<i?i', 5, True, len(types)))
+    for class_id, flat in types:
+        meta.write(struct.pack('<i?h', class_id, False, 0 if class_id == 114 else -1))
+        if class_id == 114:
+            meta.write(b'\0' * 16)  # script hash
+        meta.write(b'\0' * 16)  # type hash
+        meta.write(type_blob(flat))
+        meta.write(struct.pack('<i', 0))
+
+    data = io.BytesIO()
+    entries = []
+    for path_id, (class_id, flat, value) in enumerate(objects, 1):
+        start = data.tell()
+        write_value(data, node_tree(flat), value)
+        entries.append((path_id, start, data.tell() - start, type_index[id(flat)]))
+        data.write(b'\0' * (-data.tell() % 8))
+
+    meta.write(struct.pack('<i', len(entries)))
+    for entry in entries:
+        # The 48 byte header keeps this aligned in the file too
+        meta.write(b'\0' * (-meta.tell() % 4))
+        meta.write(struct.pack('<qqIi', *entry))
+    meta.write(struct.pack('<iii', 0, 0, 0) + b'\0')
+
+    meta = meta.getvalue()
+    data_offset = 48 + len(meta)
+    data_offset += -data_offset % 16
+    out = io.BytesIO()
+    out.write(struct.pack('>IIII', 0, 0, 22, 0) + b'\0' * 4)
+    out.write(struct.pack('>IqqQ', len(meta), data_offset + data.tell(), data_offset, 0))
+    out.write(meta)
+    out.write(b'\0' * (data_offset - out.tell()))
+    out.write(data.getvalue())
+    return out.getvalue()
+
+
+def texture(name, img):
+    """Texture2D object holding an RGBA32 image"""
+
+    img = img.convert('RGBA')
+    w, h = img.size
+    raw = img.transpose(Image.FLIP_TOP_BOTTOM).tobytes()  # rows are stored bottom up
+    return (28, TEXTURE2D, {
+        'm_Name': name, 'm_ForcedFallbackFormat': 4, 'm_DownscaleFallback': False,
+        'm_IsAlphaChannelOptional': False, 'm_Width': w, 'm_Height': h,
+        'm_CompleteImageSize': len(raw), 'm_MipsStripped': 0, 'm_TextureFormat': 4,
+        'm_MipCount': 1, 'm_IsReadable': True, 'm_IsPreProcessed': False,
+        'm_IgnoreMasterTextureLimit': False, 'm_StreamingMipmaps': False,
+        'm_StreamingMipmapsPriority': 0, 'm_ImageCount': 1, 'm_TextureDimension': 2,
+        'm_TextureSettings': {'m_FilterMode': 1, 'm_Aniso': 1, 'm_MipBias': 0.0,
+                              'm_WrapU': 1, 'm_WrapV': 1, 'm_WrapW': 1},
+        'm_LightmapFormat': 0, 'm_ColorSpace': 1, 'm_PlatformBlob': [],
+        'image data': raw, 'm_StreamData': {'offset': 0, 'size': 0, 'path': ''}
+    })
+
+
+def text_asset(name, text):
+    return (49, TEXTASSET, {'m_Name': name, 'm_Script': text})
+
+
+def mono(flat, name, value):
+    return (114, flat, dict(value, m_Name=name, m_Enabled=1,
+                            m_GameObject={'m_FileID': 0, 'm_PathID': 0},
+                            m_Script={'m_FileID': 0, 'm_PathID': 0}))
+
+
+def encode(text):
+    """Base64 UTF-16, the way the game stores its tables"""
+
+    return base64.b64encode(text.encode('utf-16le')).decode('ascii')
+
+
+def picture(seed, size):
+    """Blocky random image, so PNGs compress like real art rather than noise"""
+
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (size[1] // 8 + 1, size[0] // 8 + 1, 4), dtype=np.uint8)
+    blocks[..., 3] = 255
+    pixels = blocks.repeat(8, axis=0).repeat(8, axis=1)[:size[1], :size[0]]
+    return Image.fromarray(np.ascontiguousarray(pixels), 'RGBA')
+
+
+def make_version(folder, config, edited):
+    """Write one version's bundles, edited marks the later version"""
+
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(1)
+
+    def changed(i):
+        return edited and rng.random() < config['changed']
+
+    def save(name, objects):
+        with open(os.path.join(folder, f"{name}.unity3d"), 'wb') as f:
+            f.write(serialized_file(objects))
+
+    # Textures, all but every tenth with an alpha mask
+    size = (config['texture_size'], config['texture_size'])
+    objects = []
+    for i in range(config['textures']):
+        objects.append(texture(f"icon_{i}", picture(i + 10**6 * changed(i), size)))
+        if i % 10:
+            mask = Image.fromarray(np.full(size, 64 + i % 192, dtype=np.uint8), 'L')
+            objects.append(texture(f"icon_{i}_alpha", mask))
+    save('ui_bench', objects)
+
+    # CSV tables, maps and skills
+    objects = []
+    for t in range(config['tables']):
+        rows = ["id\tname\tvalue\tnote"] + [
+            f"{i}\tname {i}\t{i * (7 + changed(i))}\tsome longer text for row {i}"
+            for i in range(config['rows'])
+        ]
+        objects.append(text_asset(f"TABLE_{t}", encode('\r\n'.join(rows) + '\r\n')))
+    for m in range(config['maps']):
+        entries = [json.dumps({'id': i, 'tiles': [i, m, changed(i)], 'name': f"tile {i}"})
+                   for i in range(config['map_objects'])]
+        # Half the maps are missing the commas between objects
+        objects.append(text_asset(str(1000 + m), encode('[' + (',\n' if m % 2 else '\n').join(entries) + ']')))
+    skills = [{'id': i, 'heroGroupId': i % 300, 'ultimateSkillGauge': 100 + changed(i),
+               'dangerSkillGauge': 0, 'desc': f"skill {i}" + " edited" * changed(i)}
+              for i in range(config['skills'])]
+    if edited:
+        skills = skills[len(skills) // 100:] + [
+            dict(skills[0], id=config['skills'] + i) for i in range(len(skills) // 100)
+        ]
+    objects.append(mono(HERO_SKILL, 'HERO_SKILL', {'values': skills}))
+    save('text', objects)
+
+    # One bundle per locale
+    keys = [f"KEY_{i}" for i in range(config['strings'])]
+    for locale in LOCALES[:config['locales']]:
+        values = [f"{locale} string {i}" + " edited" * changed(i) for i in range(config['strings'])]
+        table = {'keys': keys, 'values': values}
+        if edited:
+            table = {'keys': keys[1:] + ['KEY_NEW'], 'values': values[1:] + [f"{locale} new"]}
+        save(f"localization_{locale}", [mono(LOCALIZATION, f"Localization_{locale}", {'valueTable': table})])
+
+    save('newcontents_bench', [texture(f"banner_{i}", picture(500 + i + changed(i), (256, 128)))
+                               for i in range(config['newcontents'])])
+
+
+def run(root, current, past):
+    """Run Unpack on one version, returns the wall time and stage metrics"""
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        start = time()
+        datamine.Unpack(current, past, 'none', offline=True)
+        seconds = time() - start
+    finally:
+        os.chdir(cwd)
+    with open(os.path.join(root, "_Game Files", current, datamine.METRICS), encoding='utf8') as f:
+        metrics = json.load(f)
+    return seconds, metrics
+
+
+def benchmark(config, repeat):
+    """Build the two versions once, then time unpacking the later one"""
+
+    results = {'config': config, 'runs': [], 'stages': {}}
+    with tempfile.TemporaryDirectory() as root:
+        games = os.path.join(root, "_Game Files")
+        print(Fore.MAGENTA + Style.BRIGHT + "Building synthetic versions" + Style.RESET_ALL)
+        os.makedirs(os.path.join(games, 'base'))
+        make_version(os.path.join(games, 'a'), config, False)
+        make_version(os.path.join(games, 'pristine'), config, True)
+
+        # Unpacked once, as the version every run is compared to
+        print(Fore.MAGENTA + Style.BRIGHT + "Unpacking the previous version" + Style.RESET_ALL)
+        run(root, 'a', 'base')
+
+        for i in range(repeat):
+            print(Fore.MAGENTA + Style.BRIGHT + f"Benchmark run {i + 1}/{repeat}" + Style.RESET_ALL)
+            shutil.rmtree(os.path.join(games, 'b'), ignore_errors=True)
+            shutil.copytree(os.path.join(games, 'pristine'), os.path.join(games, 'b'))
+            seconds, metrics = run(root, 'b', 'a')
+            results['runs'].append(seconds)
+
+            # Best of each stage across runs
+            stages = dict(metrics['main'], **metrics['stages'])
+            for stage, entry in stages.items():
+                best = results['stages'].get(stage)
+                if best is None or entry['wall'] < best['wall']:
+                    results['stages'][stage] = {'wall': entry['wall'], 'cpu': entry['cpu'],
+                                                'objects': entry['objects'], 'bytes': entry['bytes']}
+    results['best'] = min(results['runs'])
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta=0.05):
+    """Print the results against a baseline, returns the slower stages
+    Stages only count as slower if they lost more than min_delta seconds too"""
+
+    rows = [['stage', 'baseline', 'now', 'change']]
+    slower = []
+    stages = [('total', baseline.get('best'), results['best'])] + [
+        (stage, baseline['stages'].get(stage, {}).get('wall'), entry['wall'])
+        for stage, entry in sorted(results['stages'].items())
+    ]
+    for stage, before, after in stages:
+        if before:
+            change = after / before - 1
+            regressed = change > tolerance and after - before > min_delta
+            if regressed:
+                slower.append(stage)
+            rows.append([stage, f"{before:.3f}s", f"{after:.3f}s",
+                         f"{change:+.0%}" + (" slower" if regressed else "")])
+        else:
+            rows.append([stage, '-', f"{after:.3f}s", ''])
+    if baseline.get('config') != results['config']:
+        print(Fore.YELLOW + "Baseline was made with different sizes, times won't match" + Style.RESET_ALL)
+    print(terminaltables.AsciiTable(rows, 'benchmark').table)
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--chunk-bytes', type=int, default=datamine.CHUNK_BYTES,
+                        help="split bundles bigger than this across workers")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--output', default=RESULTS)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="slowdown of a stage that counts as a regression")
+    parser.add_argument('--min-delta', type=float, default=0.05,
+                        help="seconds a stage has to lose before it can be a regression")
+    args = parser.parse_args()
+    init()  # colorama
+
+    datamine.CHUNK_BYTES = args.chunk_bytes
+    config = {name: getattr(args, name) for name in DEFAULTS}
+    results = benchmark(config, args.repeat)
+    with open(args.output, 'w', encoding='utf8') as f:
+        json.dump(results, f, indent=4)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=4)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf8') as f:
+            slower = compare(results, json.load(f), args.tolerance, args.min_delta)
+        if slower:
+            print(Fore.RED + Style.BRIGHT + f"Slower than baseline: {', '.join(slower)}" + Style.RESET_ALL)
+            sys.exit(1)
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to make one")
+    print(Fore.GREEN + Style.BRIGHT + f"Best run took {results['best']:.2f} seconds" + Style.RESET_ALL)
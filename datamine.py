@@ -1,35 +1,824 @@
 import os
+import sys
 import json
 import csv
 import base64
-import heapq
+import codecs
+import hashlib
+import zlib
 import multiprocessing as mp
+import queue
 import requests
-import io
 import re
+import sqlite3
+import difflib
 
 import UnityPy
+import numpy as np
 from shutil import copyfile
 from PIL import Image
 import csv
 
 from time import time
+from concurrent.futures import ThreadPoolExecutor
 from colorama import init, Fore, Style
 import terminaltables
 import argparse
-from textwrap import wrap
+import cProfile
+from contextlib import contextmanager
+from textwrap import wrap, indent
+from itertools import chain, islice
+from time import process_time
+
+# Peak memory is only available on unix
+try:
+    import resource
+except ImportError:
+    resource = None
 
 # Files are stored in:
 # ./_Game Files/{version_num}/{filename}
 # Previous version should not have alphas
 
 # Run "python dataminer.py {version_to_datamine} {previous_version} all"
+# Add "--offline" to use the cached hero list instead of fetching it
+# Add "--profile-bundle {name}" to cProfile every task for one bundle
+# Add "--batch {version} {version} ..." to carry on through later versions
+# Add "--store" to deduplicate files across versions, "--migrate-store" for old ones
+# Add "--index-tables" to load the decoded tables into _Game Files/_tables.sqlite
+# Add "--images fast" for quicker PNG encoding, or "--images archive" for smaller files
+# Add "--max-chunks {n}" to limit how many workers load the same bundle at once
+
+# Every unpacked bundle folder gets a manifest of file sizes and content
+# hashes, so the next version can be diffed without re-reading old files
+MANIFEST = "_manifest.json"
+MANIFEST_VERSION = 3
+CHANGES = "_changes.json"
+
+# Hashes of the raw .unity3d bundles, stored in each version folder
+BUNDLES = "_bundles.json"
+
+# Optional store of files by content hash, shared by every version.
+# Version folders then hold hardlinks into it, so a file repeated across
+# versions takes space once. Files starting with "_" are rewritten in place,
+# so they're never stored
+STORE = "_store"
+
+# Encoded TextAssets are decoded this many base64 characters at a time
+DECODE_CHUNK = 1 << 20
+BASE64_JUNK = re.compile(r'[^A-Za-z0-9+/=]')
+
+# Map TextAssets hold JSON objects written back to back, with or without commas
+JSON_SPACE = re.compile(r'\s*')
+JSON_GAP = re.compile(r'\s*,?\s*')
+
+# Bundles bigger than this are split into chunks of objects across workers
+CHUNK_BYTES = 32 * 1024 * 1024
+# Every chunk loads the whole bundle, so the chunks of one bundle may only
+# hold this many bundle bytes between them. Decompressed they take a few
+# times more
+CHUNK_MEMORY = 1024 * 1024 * 1024
+
+# PNG encoder settings for each --images profile
+IMAGE_PROFILES = {
+    'fast': {'compress_level': 1, 'optimize': False},
+    'default': {},
+    'archive': {'compress_level': 9, 'optimize': True}
+}
+
+# Images are compared by a 64 bit DCT hash of a 32x32 greyscale thumbnail.
+# Re-encoding noise stays at or below the threshold, real edits go above it
+PHASH_SIZE = 32
+PHASH_THRESHOLD = 4
+
+# Fields tried in order to identify a record in a table, the first one
+# present and unique in every record wins
+KEY_FIELDS = ('id', 'skillId', 'heroSkillId', 'uid', 'key')
+# Skills without an id field can still be identified by their hero and slot
+SKILL_KEYS = KEY_FIELDS + (('heroGroupId', 'skillType'), ('heroGroupId', 'type'),
+                           ('heroGroupId', 'tier'), ('heroGroupId', 'slot'))
+# A skill where only these changed is a T3/TP update, not a new skill
+T3TP_FIELDS = {'ultimateSkillGauge', 'dangerSkillGauge'}
+SKILLDIFF = "_skilldiff.json"
+
+# Wall and CPU time, objects and bytes per stage, written after each run
+METRICS = "_metrics.json"
+
+# Changesets of modified typetree JSON, as {STRUCTDIFF}/{bundle}/{name}.json
+STRUCTDIFF = "_structdiff"
+
+# Hero names for skill reports, cached next to the version folders
+CHARS_URL = "https://thanosvibs.money/static/data/chars.json"
+CHARS_CACHE = "_chars.json"
+CHARS_TTL = 24 * 60 * 60
+CHARS_TIMEOUT = 10
+
+
+def hash_file(path):
+    """Fast content hash of a file"""
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_image(img):
+    """Hash of an image's pixels, the same whatever it was encoded with"""
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{img.mode} {img.size}".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def dct_matrix(n):
+    """Orthonormal DCT-II matrix, the 2D DCT of x is d @ x @ d.T"""
+
+    k = np.arange(n)
+    d = np.sqrt(2 / n) * np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    d[0] /= np.sqrt(2)
+    return d
+
+
+PHASH_DCT = dct_matrix(PHASH_SIZE)
+
+
+def perceptual_hash(img):
+    """64 bit perceptual hash of an image, as hex"""
+
+    # Transparent pixels count as black, whatever colour they hold
+    thumb = img.convert('RGBA').resize((PHASH_SIZE, PHASH_SIZE), Image.BILINEAR)
+    pixels = np.asarray(thumb, dtype=np.float64)
+    grey = pixels[..., :3] @ np.array([0.299, 0.587, 0.114]) * (pixels[..., 3] / 255)
+
+    # Lowest 8x8 frequencies of the 2D DCT, compared to their median
+    low = (PHASH_DCT @ grey @ PHASH_DCT.T)[:8, :8].ravel()
+    bits = np.packbits(low > np.median(low))
+    return bits.tobytes().hex()
+
+
+def phash_distance(a, b):
+    """Number of differing bits between two perceptual hashes"""
+
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def image_entry(img):
+    """Manifest hashes for an image"""
+
+    return {'hash': hash_image(img), 'phash': perceptual_hash(img)}
+
+
+def build_manifest(folder, image_hashes=None):
+    """Hash every extracted file in a bundle folder and save the manifest
+    Images are hashed by pixels, reusing hashes computed while unpacking"""
+
+    image_hashes = image_hashes or {}
+
+    files = {}
+    for root, dirs, names in os.walk(folder):
+        rel_root = os.path.relpath(root, folder)
+        if rel_root == '.':
+            rel_root = ''
+            # Copies of new files are not part of the bundle
+            if 'new' in dirs:
+                dirs.remove('new')
+        for name in names:
+            if not rel_root and name in (MANIFEST, CHANGES):
+                continue
+            path = os.path.join(root, name)
+            rel = f"{rel_root.replace(os.sep, '/')}/{name}" if rel_root else name
+            if rel in image_hashes:
+                entry = dict(image_hashes[rel])
+            elif name.endswith('.png'):
+                with Image.open(path) as img:
+                    entry = image_entry(img)
+            else:
+                entry = {'hash': hash_file(path)}
+            entry['size'] = os.path.getsize(path)
+            files[rel] = entry
+
+    with open(os.path.join(folder, MANIFEST), 'w', encoding='utf8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, f, ensure_ascii=False)
+    return files
+
+
+def load_manifest(folder):
+    """Load a bundle folder's manifest, or None if it has none
+    Manifests from an older format count as missing"""
+
+    try:
+        with open(os.path.join(folder, MANIFEST), encoding='utf8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest['files']
+
+
+def diff_manifests(old, new):
+    """Classify files as added, modified, removed or renamed
+    Names are compared with '-' normalised to '_'"""
+
+    old_index = {path.replace('-', '_'): path for path in old}
+    seen = set()
+    added = []
+    modified = []
+    for path, entry in new.items():
+        key = path.replace('-', '_')
+        old_path = old_index.get(key)
+        if old_path is None:
+            added.append(path)
+            continue
+        seen.add(key)
+        if old[old_path]['hash'] != entry['hash']:
+            modified.append(path)
+
+    # A removed file whose content reappears under a new name was renamed
+    removed_hashes = {}
+    removed = []
+    for key, old_path in old_index.items():
+        if key not in seen:
+            removed.append(old_path)
+            removed_hashes.setdefault(old[old_path]['hash'], []).append(old_path)
+    renamed = {}
+    for path in added:
+        candidates = removed_hashes.get(new[path]['hash'])
+        if candidates:
+            renamed[path] = candidates.pop()
+    if renamed:
+        added = [x for x in added if x not in renamed]
+        moved = set(renamed.values())
+        removed = [x for x in removed if x not in moved]
+
+    return {
+        'added': added,
+        'modified': modified,
+        'removed': removed,
+        'renamed': renamed
+    }
+
+
+def altered_images(old, new, modified, threshold=PHASH_THRESHOLD):
+    """Modified images that also look different, with their pHash distance"""
+
+    old_index = {path.replace('-', '_'): path for path in old}
+    altered = {}
+    for path in modified:
+        old_entry = old[old_index[path.replace('-', '_')]]
+        if 'phash' not in new[path] or 'phash' not in old_entry:
+            continue
+        distance = phash_distance(old_entry['phash'], new[path]['phash'])
+        if distance > threshold:
+            altered[path] = distance
+    return altered
+
+
+def link_tree(src, dest):
+    """Recreate an extracted bundle folder from a previous version
+    Files are hardlinked, or copied where links aren't supported"""
+
+    for root, dirs, names in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        if rel_root == '.':
+            # The old version's new files aren't new any more
+            if 'new' in dirs:
+                dirs.remove('new')
+            names = [x for x in names if x != CHANGES]
+        os.makedirs(os.path.join(dest, rel_root), exist_ok=True)
+        for name in names:
+            source = os.path.join(root, name)
+            target = os.path.join(dest, rel_root, name)
+            # Manifests are written in place, so they must not share an inode
+            if name == MANIFEST:
+                copyfile(source, target)
+                continue
+            try:
+                os.link(source, target)
+            except OSError:
+                copyfile(source, target)
+
+
+# Decoded CSV and typetree tables of every version indexed with --index-tables.
+# Each distinct table is loaded once, versions only point at it, e.g.
+#   SELECT version, data FROM table_rows WHERE name = 'HERO_STAT.csv' AND key = '1001'
+TABLES_DB = "_tables.sqlite"
+TABLES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tables (id INTEGER PRIMARY KEY, hash TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS rows (
+    table_id INTEGER NOT NULL, row INTEGER NOT NULL, field TEXT, key TEXT, data TEXT,
+    PRIMARY KEY (table_id, row)
+);
+CREATE INDEX IF NOT EXISTS rows_key ON rows (table_id, key);
+CREATE TABLE IF NOT EXISTS versions (
+    version TEXT NOT NULL, bundle TEXT NOT NULL, name TEXT NOT NULL, table_id INTEGER NOT NULL,
+    PRIMARY KEY (version, bundle, name)
+);
+CREATE INDEX IF NOT EXISTS versions_name ON versions (name, version);
+CREATE VIEW IF NOT EXISTS table_rows AS
+    SELECT versions.version, versions.bundle, versions.name, rows.row, rows.field, rows.key, rows.data
+    FROM versions JOIN rows ON rows.table_id = versions.table_id;
+"""
+
+
+def open_tables(path):
+    """Open the tables database, workers write to it one at a time"""
+
+    db = sqlite3.connect(path, timeout=600, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.executescript(TABLES_SCHEMA)
+    return db
+
+
+def table_rows(path):
+    """Rows of a decoded table as (field, key, data), data being JSON
+    Typetree lists are keyed by their id field, CSVs by the first column.
+    Other top-level typetree fields share one row with an empty field"""
+
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf8') as f:
+            for cells in csv.reader(f):
+                yield '', cells[0] if cells else None, json.dumps(cells, ensure_ascii=False)
+        return
+
+    with open(path, encoding='utf8') as f:
+        tree = json.load(f)
+    table = tree.get('valueTable') if isinstance(tree, dict) else None
+    lists = {k: v for k, v in tree.items() if isinstance(v, list)} if isinstance(tree, dict) else {}
+    if isinstance(table, dict) and 'keys' in table and 'values' in table:
+        for key, value in zip(table['keys'], table['values']):
+            yield 'valueTable', str(key), json.dumps(value, ensure_ascii=False)
+        rest = {k: v for k, v in tree.items() if k != 'valueTable'}
+        extra = {k: v for k, v in table.items() if k not in ('keys', 'values')}
+        if extra:
+            rest['valueTable'] = extra
+    elif lists:
+        for field, records in lists.items():
+            key = detect_key(records)
+            for i, record in enumerate(records):
+                yield field, str(record[key] if key else i), json.dumps(record, ensure_ascii=False)
+        rest = {k: v for k, v in tree.items() if k not in lists}
+    else:
+        rest = tree
+    if rest or rest is tree:
+        yield '', None, json.dumps(rest, ensure_ascii=False)
+
+
+def intern_file(store, path, digest=None):
+    """Replace a file with a hardlink to the store's copy of its content
+    Returns the bytes saved, files that can't be linked are left alone"""
+
+    digest = digest or hash_file(path)
+    stored = os.path.join(store, digest[:2], digest)
+    try:
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        try:
+            os.link(path, stored)
+            return 0
+        except FileExistsError:
+            pass
+        if os.path.samefile(path, stored):
+            return 0
+        # Linked beside the file first, so it's never missing
+        os.link(stored, path + '.store')
+        os.replace(path + '.store', path)
+        return os.path.getsize(stored)
+    except OSError:
+        return 0
+
+
+def intern_tree(store, folder):
+    """Store every file in a folder, returns the bytes saved"""
+
+    saved = 0
+    for root, dirs, names in os.walk(folder):
+        dirs[:] = [x for x in dirs if not x.startswith('_')]
+        for name in names:
+            if not name.startswith('_'):
+                saved += intern_file(store, os.path.join(root, name))
+    return saved
+
+
+def migrate_store(games):
+    """Move the files of every version already unpacked into the store"""
+
+    store = os.path.join(games, STORE)
+    total = 0
+    for version in sorted(os.listdir(games)):
+        folder = os.path.join(games, version)
+        if version.startswith('_') or not os.path.isdir(folder):
+            continue
+        saved = intern_tree(store, folder)
+        total += saved
+        print(f"[store] {version}: {saved / 2**20:.1f} MiB deduplicated")
+    print(f"[store] Saved {total / 2**20:.1f} MiB in total")
+
+
+def decode_text(text, chunk_size=DECODE_CHUNK):
+    """Decode base64 UTF-16LE text a chunk at a time
+    Like b64decode, characters outside the base64 alphabet are ignored"""
+
+    decoder = codecs.getincrementaldecoder('utf-16le')()
+    pending = ''
+    for start in range(0, len(text), chunk_size):
+        block = pending + BASE64_JUNK.sub('', text[start:start + chunk_size])
+        cut = len(block) - len(block) % 4
+        pending = block[cut:]
+        yield decoder.decode(base64.b64decode(block[:cut]))
+    yield decoder.decode(base64.b64decode(pending), final=True)
+
+
+def write_encoded_csv(text, fp):
+    """Write an encoded TextAsset as CSV without holding the decoded table
+    One row per line, with fields split on tabs"""
+
+    with open(fp, 'wt', newline='', encoding='utf8') as f:
+        writer = csv.writer(f)
+        line = ''
+        for piece in decode_text(text):
+            lines = (line + piece).split('\n')
+            line = lines.pop()
+            for complete in lines:
+                writer.writerow(complete.strip().split('\t'))
+        writer.writerow(line.strip().split('\t'))
+
+
+def iter_map(text, in_array):
+    """Yield each JSON value in a map's text as it's parsed"""
+
+    decoder = json.JSONDecoder()
+    pos = JSON_SPACE.match(text).end() + in_array
+    while True:
+        pos = JSON_GAP.match(text, pos).end()
+        if in_array and text.startswith(']', pos):
+            pos = JSON_SPACE.match(text, pos + 1).end()
+            break
+        if pos == len(text):
+            if in_array:
+                raise json.JSONDecodeError("Unterminated array", text, pos)
+            break
+        value, pos = decoder.raw_decode(text, pos)
+        yield value
+    if pos != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
+
+
+def write_map(text, fp):
+    """Write a map's JSON objects to a file while they're parsed
+    Returns the number of objects, raises JSONDecodeError if it can't be read"""
+
+    in_array = text.lstrip().startswith('[')
+    values = iter_map(text, in_array)
+    with open(fp, 'wt', encoding='utf8') as f:
+        # A single object on its own is written as-is
+        head = list(islice(values, 1 if in_array else 2))
+        if not in_array and len(head) < 2:
+            if not head:
+                raise json.JSONDecodeError("Expecting value", text, 0)
+            json.dump(head[0], f, indent=4)
+            return 1
+
+        # Otherwise as a list, laid out as json.dump would
+        count = 0
+        for value in chain(head, values):
+            f.write(',\n' if count else '[\n')
+            f.write(indent(json.dumps(value, indent=4), '    '))
+            count += 1
+        f.write('\n]' if count else '[]')
+    return count
+
+
+def peek_name(obj):
+    """Read only the name of an object, without decoding the rest
+    Every named object's data starts with its m_Name string"""
+
+    obj.reset()
+    return obj.reader.read_aligned_string()
+
+
+def image_key(name):
+    """Images and their alpha masks must be unpacked by the same chunk"""
+
+    stem = os.path.splitext(name)[0].lower()
+    if stem.endswith('_alpha'):
+        stem = stem[:-6]
+    return zlib.crc32(stem.encode('utf8'))
+
+
+# Stage totals for the task running in this process, see Unpack.measured
+_metrics = {}
+
+
+def clock():
+    return time(), process_time()
+
+
+def record(stage, since, objects=0, size=0, into=None):
+    """Add the time since a clock() reading to a stage's totals"""
+
+    wall, cpu = since
+    into = _metrics if into is None else into
+    entry = into.setdefault(stage, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'objects': 0, 'bytes': 0})
+    entry['calls'] += 1
+    entry['wall'] += time() - wall
+    entry['cpu'] += process_time() - cpu
+    entry['objects'] += objects
+    entry['bytes'] += size
+
+
+@contextmanager
+def timed(stage, objects=0, size=0):
+    since = clock()
+    yield
+    record(stage, since, objects, size)
+
+
+def merge_metrics(into, stages):
+    """Add one set of stage totals to another"""
+
+    for stage, entry in stages.items():
+        total = into.setdefault(stage, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'objects': 0, 'bytes': 0})
+        for field, value in entry.items():
+            total[field] += value
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes, None if unknown"""
+
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes everywhere but macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def load_chars(cache_path, offline=False):
+    """Hero names by group id, from the cache if it's fresh, else fetched
+    Failed fetches fall back to the cache, however old, then to nothing"""
+
+    cache = None
+    try:
+        with open(cache_path, encoding='utf8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    def lookup(data):
+        return {str(x['id']): x['character'] for x in data if x['uniformed'] == 'False'}
+
+    if offline or (cache and time() - cache['fetched'] < CHARS_TTL):
+        if cache is None:
+            print("[skills] Offline with no cached chars.json, hero names unavailable")
+            return {}
+        return lookup(cache['data'])
+
+    # Ask the server whether our copy is still current
+    headers = {'If-None-Match': cache['etag']} if cache and cache.get('etag') else {}
+    try:
+        response = requests.get(CHARS_URL, headers=headers, timeout=CHARS_TIMEOUT)
+        if response.status_code == 304:
+            cache['fetched'] = time()
+        elif response.status_code == 200:
+            cache = {'etag': response.headers.get('ETag'), 'fetched': time(),
+                     'data': json.loads(response.content.decode('utf-8'))}
+        else:
+            raise requests.HTTPError(response.status_code)
+    except (requests.RequestException, ValueError) as e:
+        print(f"[skills] Failed to retrieve chars.json: {e}")
+        if cache is None:
+            return {}
+        print("[skills] Using the cached copy")
+        return lookup(cache['data'])
+
+    with open(cache_path, 'w', encoding='utf8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    return lookup(cache['data'])
+
+
+def paired_table(table):
+    """Key to value dict of a {'keys': [...], 'values': [...]} table, like a
+    Localization valueTable, None if the dict isn't one"""
+
+    if set(table) != {'keys', 'values'}:
+        return None
+    keys = table['keys']
+    values = table['values']
+    if not isinstance(keys, list) or not isinstance(values, list) or len(keys) != len(values):
+        return None
+    pairs = dict(zip(keys, values))
+    return pairs if len(pairs) == len(keys) else None
+
+
+def element_token(value):
+    """Hashable stand-in for a JSON value, for aligning lists"""
+
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return type(value).__name__, value
+
+
+def diff_aligned(old, new, path):
+    """Diff lists without ids by aligning equal elements first, so one
+    insertion doesn't turn every later element into a change. Removed
+    elements are given at their old index, everything else at the new one"""
+
+    # Repeated values are normal in numeric arrays, so they mustn't become junk
+    matcher = difflib.SequenceMatcher(None, [element_token(x) for x in old],
+                                      [element_token(x) for x in new], autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == 'equal':
+            continue
+        # Replaced runs are diffed pairwise, whatever is left over was added or removed
+        paired = min(i2 - i1, j2 - j1)
+        for offset in range(paired):
+            yield from diff_tree(old[i1 + offset], new[j1 + offset], path + (j1 + offset,))
+        for j in range(j1 + paired, j2):
+            yield 'add', path + (j,), [new[j]]
+        for i in range(i1 + paired, i2):
+            yield 'remove', path + (i,), [old[i]]
+
+
+def diff_tree(old, new, path=()):
+    """Yield every difference between two JSON trees as (op, path, values)
+    List elements are matched by their id field when they have one, and
+    equal subtrees are skipped without being walked"""
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        old_index = paired_table(old)
+        new_index = paired_table(new)
+        if old_index is not None and new_index is not None:
+            # Keys and values are parallel lists, so pair them up
+            step = lambda k: {'key': k}
+        else:
+            old_index = old
+            new_index = new
+            step = lambda k: k
+    elif isinstance(old, list) and isinstance(new, list):
+        key = detect_key(new)
+        if key and detect_key(old, (key,)):
+            old_index = index_records(old, key)
+            new_index = index_records(new, key)
+            step = lambda k: {key: k}
+        else:
+            yield from diff_aligned(old, new, path)
+            return
+    else:
+        yield 'change', path, [old, new]
+        return
+
+    for k, value in new_index.items():
+        if k not in old_index:
+            yield 'add', path + (step(k),), [value]
+        elif old_index[k] != value:
+            yield from diff_tree(old_index[k], value, path + (step(k),))
+    for k, value in old_index.items():
+        if k not in new_index:
+            yield 'remove', path + (step(k),), [value]
+
+
+def diff_strings(new, old):
+    """Compare two localisation valueTables in one ordered pass
+    Tables without keys are paired by position"""
+
+    def pairs(table):
+        values = table['values']
+        return dict(zip(table.get('keys', range(len(values))), values))
+
+    new = pairs(new)
+    old = pairs(old)
+    added = []
+    modified = []
+    for key, string in new.items():
+        if key not in old:
+            added.append((key, string))
+        elif old[key] != string:
+            modified.append((key, old[key], string))
+    removed = [(key, string) for key, string in old.items() if key not in new]
+    return {'added': added, 'removed': removed, 'modified': modified}
+
+
+def record_key(record, key):
+    """Value of a key field, or a tuple of values for a tuple of fields"""
+
+    if isinstance(key, tuple):
+        values = tuple(record.get(field) for field in key)
+        return None if None in values else values
+    return record.get(key)
+
+
+def detect_key(records, candidates=KEY_FIELDS):
+    """Find the field, or tuple of fields, that identifies each record,
+    None if there isn't one"""
+
+    for field in candidates:
+        seen = set()
+        for record in records:
+            value = record_key(record, field) if isinstance(record, dict) else None
+            parts = value if isinstance(field, tuple) else (value,)
+            if value is None or any(isinstance(x, (dict, list)) for x in parts) or value in seen:
+                break
+            seen.add(value)
+        else:
+            if seen:
+                return field
+    return None
+
+
+def index_records(records, key=None):
+    """Index records by their key field, or by position without one"""
+
+    if key is None:
+        return dict(enumerate(records))
+    return {record_key(record, key): record for record in records}
+
+
+def diff_records(old, new):
+    """Compare two indexes, giving added and removed keys and the
+    changed fields of each modified record"""
+
+    added = []
+    modified = {}
+    for key, record in new.items():
+        if key not in old:
+            added.append(key)
+        elif record != old[key]:
+            previous = old[key]
+            if isinstance(record, dict) and isinstance(previous, dict):
+                modified[key] = sorted(
+                    field for field in record.keys() | previous.keys()
+                    if field not in record or field not in previous
+                    or record[field] != previous[field]
+                )
+            else:
+                modified[key] = []
+    removed = [key for key in old if key not in new]
+    return {'added': added, 'removed': removed, 'modified': modified}
+
+
+def diff_contents(old, new, ignore=()):
+    """Compare lists of records without a key by their contents, so an
+    insertion doesn't shift every later record. Records that only differ
+    in the ignored fields are paired up as modified. Removed records are
+    given by their old index, everything else by the new one"""
+
+    def token(record, skip=()):
+        if isinstance(record, dict) and skip:
+            record = {k: v for k, v in record.items() if k not in skip}
+        return json.dumps(record, sort_keys=True)
+
+    existing = {}
+    for i, record in enumerate(old):
+        existing.setdefault(token(record), []).append(i)
+    unmatched = []
+    for j, record in enumerate(new):
+        indices = existing.get(token(record))
+        if indices:
+            indices.pop(0)
+        else:
+            unmatched.append(j)
+    left = sorted(i for indices in existing.values() for i in indices)
+
+    # Pair what's left over where only the ignored fields differ
+    modified = {}
+    if ignore:
+        loose = {}
+        for i in left:
+            loose.setdefault(token(old[i], ignore), []).append(i)
+        for j in unmatched:
+            candidates = loose.get(token(new[j], ignore))
+            if candidates:
+                i = candidates.pop(0)
+                modified[j] = diff_records({0: old[i]}, {0: new[j]})['modified'].get(0, [])
+        left = sorted(i for indices in loose.values() for i in indices)
+    added = [j for j in unmatched if j not in modified]
+    return {'added': added, 'removed': left, 'modified': modified}
+
 
 class Unpack:
-    def __init__(self, current, past, reformat):
+    def __init__(self, current, past, reformat, images='default',
+                 phash_threshold=PHASH_THRESHOLD, skill_history=(), offline=False,
+                 profile_bundle=None, past_index=None, store=False, tables=False,
+                 max_chunks=None):
 
+        started = clock()
+        # Stage totals left over from an earlier Unpack in this process
+        _metrics.clear()
         self.current = current
         self.past = past
+        # Older versions the skills are also diffed against
+        self.skill_history = [x for x in skill_history if x != past]
+        self.image_options = IMAGE_PROFILES[images]
+        self.phash_threshold = phash_threshold
+        self.profile_bundle = profile_bundle
+        self.store = os.path.abspath(f"./_Game Files/{STORE}") if store else None
+        self.tables = os.path.abspath(f"./_Game Files/{TABLES_DB}") if tables else None
+        self.max_chunks = max_chunks
+        # Workers use absolute paths, so tasks from any bundle can share a process
+        self.path = os.path.abspath(f"./_Game Files/{current}")
+        self.past_path = os.path.abspath(f"./_Game Files/{past}")
         self.report = {
             'newfiles': []
         }
@@ -66,337 +855,736 @@ class Unpack:
                         unities.append(thing)
                     else:
                         newcontents.append(thing)
+        # Bundles identical to the previous version are linked, not unpacked
+        with timed('skip_unchanged', len(unities)):
+            unities = self.skip_unchanged(unities)
         self.report['files'] = [x[:-8] for x in unities]
 
-        p = mp.Pool()
-        p.map(self.unpack, unities)
+        # Hero names are fetched on a thread while the bundles unpack
+        skills = "_skillreport.txt" not in os.listdir('.')
+        fetcher = ThreadPoolExecutor(1)
+
+        # Largest work first, so big bundles don't finish long after the rest
+        with timed('schedule', len(unities)):
+            tasks = self.schedule(unities)
+        remaining = {}
+        fails = {}
+        image_hashes = {}
+        for filename, chunk, chunks in tasks:
+            remaining[filename] = chunks
+            fails[filename] = []
+            image_hashes[filename] = {}
 
         # Look for "new contents" files
-        os.chdir(f'./../{current}')
         if len(newcontents) > 0 and 'NewContents' not in os.listdir('.'):
-            print(Fore.MAGENTA + Style.BRIGHT +
-                  "Beginning new contents extraction" + Style.RESET_ALL)
             print(f"[unpacking] Creating folder NewContents")
             os.mkdir('NewContents')
             self.report['files'] = self.report['files'] + [x[:-8] for x in newcontents]
+        else:
+            newcontents = []
+
+        # Analysis stages, each waiting on the bundle it reads
+        waiting = []
+        if skills:
+            waiting.append(('text.unity3d', 'skills'))
+        if "_newstrings.txt" not in os.listdir('.'):
+            for thing in sorted(os.listdir('.')):
+                if thing.lower().startswith('localization_') and os.path.isdir(thing):
+                    waiting.append((thing + '.unity3d', thing))
+
+        # Every pool task reports back through this queue, so a stage can
+        # start as soon as its input is ready instead of after every bundle
+        events = queue.Queue()
+        running = 0
+        chars = None
+        # Skills and strings of the previous version, if the last run kept them.
+        # Never stored on self, which is sent to the workers with every task
+        past_index = past_index or {'skills': None, 'locales': {}}
+        index = {'skills': None, 'locales': {}}
+        self.report['altered'] = []
+        self.report['locales'] = {}
+        self.report['counts'] = {}
+        self.report['bundles'] = {}
+        bundle_count = len(remaining)
+        metrics = {'version': self.current, 'stages': {}, 'bundles': {}, 'workers': {}}
+        with mp.Pool() as p:
+            def start(stage, bundle, func, *args):
+                p.apply_async(self.measured, (stage, bundle, func.__name__, args),
+                              callback=lambda result: events.put((stage, bundle, result)),
+                              error_callback=lambda error: events.put(('error', bundle, error)))
+                return 1
+
+            # Started after the workers fork, so they don't inherit the thread
+            if skills:
+                future = fetcher.submit(load_chars,
+                                        os.path.join(os.path.dirname(self.path), CHARS_CACHE),
+                                        offline)
+                future.add_done_callback(lambda future: events.put(('chars', None, future)))
+                running += 1
+            for task in tasks:
+                running += start('unpack', task[0].replace('.unity3d', ''), self.unpack, task)
+
+            # Unchanged bundles are indexed straight away, the rest once they're finished
+            if self.tables:
+                open_tables(self.tables).close()
+                for foldername in self.report['unchanged']:
+                    running += start('tables', foldername, self.index_tables, foldername)
+            if len(newcontents) > 0:
+                print(Fore.MAGENTA + Style.BRIGHT +
+                      "Beginning new contents extraction" + Style.RESET_ALL)
             for newcontent in newcontents:
-                self.extract_nc(newcontent)
+                running += start('newcontents', newcontent.replace('.unity3d', ''),
+                                 self.extract_nc, newcontent)
 
-        # Look for new skills
-        if "_skillreport.txt" not in os.listdir('.'):
-            print(Fore.MAGENTA + Style.BRIGHT +
-                "Beginning skill comparison" + Style.RESET_ALL)
-            self.new_skills()
+            while True:
+                for stage in [x for x in waiting if x[0] not in remaining]:
+                    filename, name = stage
+                    if name == 'skills' and chars is not None:
+                        print(Fore.MAGENTA + Style.BRIGHT +
+                            "Beginning skill comparison" + Style.RESET_ALL)
+                        running += start('skills', 'text', self.new_skills, chars,
+                                         past_index['skills'])
+                        waiting.remove(stage)
+                    elif name != 'skills':
+                        print(Fore.MAGENTA + Style.BRIGHT +
+                            f"Beginning localisation file comparison for {name}" + Style.RESET_ALL)
+                        running += start('locale', name, self.compare_localisation, name,
+                                         past_index['locales'].get(name))
+                        waiting.remove(stage)
+                if running == 0:
+                    break
 
-        # Compare localisation files
-        if "_newstrings.txt" not in os.listdir('.'):
-            print(Fore.MAGENTA + Style.BRIGHT +
-                "Beginning localisation file comparison" + Style.RESET_ALL)
-            self.compare_localisation()
+                stage, bundle, result = events.get()
+                running -= 1
+                if stage == 'error':
+                    raise result
+                elif stage != 'chars':
+                    result, task_metrics = result
+                    merge_metrics(metrics['stages'], task_metrics['stages'])
+                    merge_metrics(metrics['bundles'].setdefault(bundle, {}), task_metrics['stages'])
+                    if task_metrics['rss'] is not None:
+                        pid = str(task_metrics['pid'])
+                        metrics['workers'][pid] = max(metrics['workers'].get(pid, 0), task_metrics['rss'])
+
+                if stage == 'chars':
+                    chars = result.result()
+                elif stage == 'unpack':
+                    filename = result['filename']
+                    foldername = filename.replace('.unity3d', '')
+                    remaining[filename] -= 1
+                    fails[filename] += result['fails']
+                    image_hashes[filename].update(result['hashes'])
+                    bundle = self.report['bundles'].setdefault(
+                        foldername, {'counts': {}, 'new': 0, 'fails': 0, 'seconds': 0})
+                    bundle['seconds'] += result['seconds']
+                    for kind, count in result['counts'].items():
+                        bundle['counts'][kind] = bundle['counts'].get(kind, 0) + count
+                        self.report['counts'][kind] = self.report['counts'].get(kind, 0) + count
+                    if remaining[filename] == 0:
+                        del remaining[filename]
+                        bundle['fails'] = len(fails[filename])
+                        print(f"[progress] Unpacked {bundle_count - len(remaining)}/{bundle_count} "
+                              f"bundles, {foldername} took {bundle['seconds']:.1f}s")
+                        running += start('finish', foldername, self.finish,
+                                         foldername,
+                                         sorted(fails[filename]),
+                                         image_hashes[filename])
+                elif stage == 'finish':
+                    bundle = self.report['bundles'][result['bundle']]
+                    bundle['new'] = len(result['new'])
+                    bundle['seconds'] += result['seconds']
+                    if len(result['new']) > 0:
+                        self.report['newfiles'].append(result['bundle'])
+                    self.report['altered'] += result['altered']
+                    if self.tables:
+                        running += start('tables', result['bundle'], self.index_tables, result['bundle'])
+                elif stage == 'skills':
+                    self.report.update(result[0])
+                    index['skills'] = result[1]
+                elif stage == 'locale' and result is not None:
+                    self.report['locales'][result[0]] = result[1]
+                    index['locales'][bundle] = result[2]
+        fetcher.shutdown()
+        # For the next version in a batch, now the pool is done with self
+        self.index = index
+
+        if 'en' in self.report['locales']:
+            self.report['added'] = self.report['locales']['en']['added']
+            self.report['removed'] = self.report['locales']['en']['removed']
+            self.report['changed'] = self.report['locales']['en']['modified']
+
+        # Stages the parent ran itself, then the run as a whole
+        metrics['main'] = {stage: dict(entry) for stage, entry in _metrics.items()}
+        record('total', started, into=metrics)
+        metrics['main_rss'] = peak_rss()
+        # Objects, new files, fails and seconds of every unpacked bundle
+        metrics['results'] = self.report['bundles']
+        with open(METRICS, 'w', encoding='utf8') as f:
+            json.dump(metrics, f, indent=4)
+        print(f"[metrics] Wrote stage timings and bundle results to {METRICS}")
 
         self.make_report()
 
-    def unpack(self, filename):
-        """Unpack the unity file"""
+    def measured(self, stage, bundle, name, args):
+        """Run a pool task, returning its result with the stage totals
+        and peak memory of the worker, profiled if it's the chosen bundle"""
 
-        print(Fore.MAGENTA + Style.BRIGHT +
-                f"Beginning unpack for file {filename}" + Style.RESET_ALL)
+        _metrics.clear()
+        since = clock()
+        if bundle == self.profile_bundle:
+            profile = cProfile.Profile()
+            result = profile.runcall(getattr(self, name), *args)
+            suffix = f"_{args[0][1]}" if stage == 'unpack' else ''
+            profile.dump_stats(os.path.join(self.path, f"_profile_{bundle}_{stage}{suffix}.prof"))
+        else:
+            result = getattr(self, name)(*args)
+        record(stage, since)
+        return result, {'stages': dict(_metrics), 'pid': os.getpid(), 'rss': peak_rss()}
+
+    def skip_unchanged(self, unities):
+        """Link bundles that haven't changed since the previous version
+        Returns the bundles that still need unpacking"""
+
+        print("[skip] Hashing bundles")
+        hashes = {}
+        if BUNDLES in os.listdir('.'):
+            with open(BUNDLES, encoding='utf8') as f:
+                hashes = json.load(f)
+        for unity in unities:
+            hashes[unity] = hash_file(unity)
+            if self.store:
+                intern_file(self.store, unity, hashes[unity])
+        with open(BUNDLES, 'w', encoding='utf8') as f:
+            json.dump(hashes, f, indent=4)
+
+        past = f'../{self.past}'
+        past_hashes = {}
+        if BUNDLES in os.listdir(past):
+            with open(f'{past}/{BUNDLES}', encoding='utf8') as f:
+                past_hashes = json.load(f)
+
+        changed = []
+        self.report['unchanged'] = []
+        for unity in unities:
+            foldername = unity.replace('.unity3d', '')
+            if not os.path.isdir(f'{past}/{foldername}'):
+                changed.append(unity)
+                continue
+
+            # Versions from before bundle hashes were stored
+            if unity not in past_hashes and os.path.isfile(f'{past}/{unity}'):
+                past_hashes[unity] = hash_file(f'{past}/{unity}')
+
+            if past_hashes.get(unity) == hashes[unity]:
+                print(f"[skip] {unity} is unchanged, linking {self.past}/{foldername}")
+                link_tree(f'{past}/{foldername}', foldername)
+                self.report['unchanged'].append(foldername)
+            else:
+                changed.append(unity)
+
+        return changed
+
+    def schedule(self, unities):
+        """Split bundles into tasks of (filename, chunk, chunks), largest first
+        Big bundles are split so their objects are spread across workers,
+        as long as the copies of the bundle they load fit in CHUNK_MEMORY"""
 
-        env = UnityPy.load(filename)
+        tasks = []
+        workers = min(mp.cpu_count(), self.max_chunks or mp.cpu_count())
+        for filename in unities:
+            size = os.path.getsize(os.path.join(self.path, filename))
+            chunks = max(1, min(workers, size // CHUNK_BYTES, CHUNK_MEMORY // max(size, 1)))
 
-        # Create folder
+            # Create folder
+            foldername = filename.replace('.unity3d', '')
+            print(f"[unpacking] Creating folder {foldername}")
+            os.mkdir(os.path.join(self.path, foldername))
+
+            for chunk in range(chunks):
+                tasks.append((size / chunks, (filename, chunk, chunks)))
+
+        tasks.sort(key=lambda x: x[0], reverse=True)
+        return [task for size, task in tasks]
+
+    def unpack(self, task):
+        """Unpack one chunk of the unity file
+        Returns a record of what was unpacked, for the parent to aggregate"""
+
+        start = time()
+        filename, chunk, chunks = task
+        print(Fore.MAGENTA + Style.BRIGHT +
+                f"Beginning unpack for file {filename} ({chunk + 1}/{chunks})" + Style.RESET_ALL)
+
+        with timed('load', size=os.path.getsize(os.path.join(self.path, filename))):
+            env = UnityPy.load(os.path.join(self.path, filename))
         foldername = filename.replace('.unity3d', '')
-        print(f"[unpacking] Creating folder {foldername}")
-        os.mkdir(foldername)
+        folder = os.path.join(self.path, foldername)
 
         # Unpack files
         print(f"[unpacking] Starting unpacking")
-        for obj in env.objects:
-            
-            # Images
+        images = {}
+        counts = {}
+        map_stats = {'maps': 0, 'objects': 0, 'failed': 0}
+        for i, obj in enumerate(env.objects):
+
+            # Images, saved after pairing them with their alpha masks
             if obj.type.name in ['Texture2D', 'Sprite']:
-                data = obj.read()
+                name = peek_name(obj)
+                # Decided by name, images with the same name overwrite each other
+                if chunks > 1 and image_key(name) % chunks != chunk:
+                    continue
                 if filename == "ui_skillicons.unity3d":
-                    dest = os.path.join(f"./{foldername}",
-                                        data.name.lower())  # output destination
-                else:
-                    dest = os.path.join(f"./{foldername}",
-                                        data.name)  # output destination
-                dest, ext = os.path.splitext(dest)
-                dest = dest + ".png"
-                img = data.image
-                img.save(dest)
-                
+                    name = name.lower()
+                images[os.path.splitext(name)[0]] = obj
+                counts[obj.type.name] = counts.get(obj.type.name, 0) + 1
+                continue
+
+            if i % chunks != chunk:
+                continue
+            counts[obj.type.name] = counts.get(obj.type.name, 0) + 1
+            since = clock()
+
             # JSON data files
-            elif obj.type.name == 'MonoBehaviour':
+            if obj.type.name == 'MonoBehaviour':
                 if obj.serialized_type.nodes:
                     # save decoded data
                     tree = obj.read_typetree()
-                    fp = os.path.join(f"./{foldername}", f"{obj.read().name}.json")
+                    fp = os.path.join(folder, f"{obj.read().name}.json")
                     with open(fp, "wt", encoding = "utf8") as f:
                         json.dump(tree, f, ensure_ascii = False, indent = 4)
                 else:
                     # save raw relevant data (without Unity MonoBehaviour header)
                     data = obj.read()
-                    fp = os.path.join(f"./{foldername}", f"{data.name}.bin")
+                    fp = os.path.join(folder, f"{data.name}.bin")
                     with open(fp, "wb") as f:
                         f.write(data.raw_data)
-                        
+
             # CSV and plaintext data files
             elif obj.type.name == "TextAsset":
                 data = obj.read()
 
                 # "Bad words" - unencoded, save as plaintext
                 if "BAD_WORDS" in data.name:
-                    fp = os.path.join(f'./{foldername}', f"{data.name}.txt")
+                    fp = os.path.join(folder, f"{data.name}.txt")
                     with open(fp, 'wt', encoding='utf8') as f:
                         f.write(data.text)
-                        
+
                 # "Map data" - encoded JSON, save into separate files
                 elif data.name.isnumeric():
-                    folder_path = os.path.join(f'./{foldername}', 'maps')
+                    folder_path = os.path.join(folder, 'maps')
                     os.makedirs(folder_path, exist_ok=True)
-                    
-                    byte_string = base64.b64decode(data.text)
-                    decoded_string = byte_string.decode('utf-16le')
-                    fixed_json_string = re.sub(r'}\s*{', '},{', decoded_string)
-                    json_data = []
+
+                    decoded_string = ''.join(decode_text(data.text))
+                    fp = os.path.join(folder_path, f"{data.name}.json")
                     try:
-                        json_data = json.loads(fixed_json_string)
-                        fp = os.path.join(f'./{foldername}', 'maps', f"{data.name}.json")
-                    except json.decoder.JSONDecodeError:
-                        json_data = "Failed :("
-                        fp = os.path.join(f'./{foldername}', 'maps', f"FAIL_{data.name}.json")
-                    with open(fp, 'wt', encoding='utf8') as f:
-                        json.dump(json_data, f, indent=4)
-                
+                        count = write_map(decoded_string, fp)
+                        map_stats['maps'] += 1
+                        map_stats['objects'] += count
+                        print(f"[maps] {data.name}: {count} objects, {len(decoded_string)} chars")
+                    except json.decoder.JSONDecodeError as e:
+                        os.remove(fp)
+                        map_stats['failed'] += 1
+                        print(f"[maps] {data.name}: failed at char {e.pos} ({e.msg})")
+                        fp = os.path.join(folder_path, f"FAIL_{data.name}.json")
+                        with open(fp, 'wt', encoding='utf8') as f:
+                            json.dump("Failed :(", f, indent=4)
+
                 # Anything else - encoded CSV
                 else:
-                    fp = os.path.join(f'./{foldername}', f"{data.name}.csv")
-                    byte_string = base64.b64decode(data.text)
-                    decoded_string = byte_string.decode('utf-16le')
-                    decoded_lines = decoded_string.split('\n')
-                    decoded_data = [line.strip().split('\t') for line in decoded_lines]
-                    with open(fp, 'wt', newline='', encoding='utf8') as f:
-                        writer = csv.writer(f)
-                        writer.writerows(decoded_data)
+                    fp = os.path.join(folder, f"{data.name}.csv")
+                    write_encoded_csv(data.text, fp)
+
+            record(obj.type.name, since, 1, obj.byte_size)
+
+        fail_list, hashes = self.unmask(folder, images, foldername.lower() != "ui_skillicons")
+
+        if map_stats['maps'] or map_stats['failed']:
+            print(
+                f"[maps] Decoded {map_stats['maps']} maps with {map_stats['objects']} objects, "
+                f"{map_stats['failed']} failed"
+            )
 
         print(f"[unpacking] Finished unpacking")
 
-        self.unmask(foldername)
+        return {
+            'filename': filename,
+            'counts': counts,
+            'fails': fail_list,
+            'hashes': hashes,
+            'seconds': time() - start
+        }
 
-    def unmask(self, foldername):
-        """Unmask using alphas"""
+    def unmask(self, folder, images, masked=True):
+        """Unmask using alphas, then save every image once
+        Returns the images that have no usable alpha, and the pixel hashes"""
 
-        os.chdir(f"./{foldername}")
         fail_list = []
+        used_masks = set()
+        hashes = {}
 
-        if foldername.lower() != "ui_skillicons":   
+        if masked:
             print(f"[unmask] Starting unmasking")
-            for name in os.listdir('.'):
-                if 'alpha' not in name and ".png" in name:
-                    try:
-                        mask = Image.open(name[:-4] +
-                                          "_alpha.png").convert('L')
-                        img = Image.open(name).convert('RGBA')
-                        w, h = img.size
-                        slate = Image.new('RGBA', (w, h))
-                        slate.paste(img, (0, 0), mask)
-                        slate.save(f'{name}')
-                        os.remove(name[:-4] + "_alpha.png")
-                    except (FileNotFoundError, ValueError):
-                        fail_list.append(name)
+        for stem, obj in images.items():
+            if masked and 'alpha' in stem:
+                continue
+            with timed('decode', 1, obj.byte_size):
+                img = obj.read().image
+
+            mask = images.get(stem + "_alpha") if masked else None
+            if masked and mask is None:
+                fail_list.append(f"{stem}.png")
+            elif mask is not None:
+                try:
+                    with timed('decode', 1, mask.byte_size):
+                        mask = mask.read().image.convert('L')
+                    since = clock()
+                    w, h = img.size
+                    slate = Image.new('RGBA', (w, h))
+                    slate.paste(img.convert('RGBA'), (0, 0), mask)
+                    img = slate
+                    used_masks.add(stem + "_alpha")
+                    record('unmask', since, 1)
+                except ValueError:
+                    fail_list.append(f"{stem}.png")
+
+            with timed('encode', 1):
+                img.save(os.path.join(folder, f"{stem}.png"), **self.image_options)
+            with timed('image_hash', 1):
+                hashes[f"{stem}.png"] = image_entry(img)
+
+        # Masks that weren't applied are kept
+        if masked:
+            for stem, obj in images.items():
+                if 'alpha' in stem and stem not in used_masks:
+                    with timed('decode', 1, obj.byte_size):
+                        img = obj.read().image
+                    with timed('encode', 1):
+                        img.save(os.path.join(folder, f"{stem}.png"), **self.image_options)
+                    with timed('image_hash', 1):
+                        hashes[f"{stem}.png"] = image_entry(img)
+
+        return fail_list, hashes
+
+    def finish(self, foldername, fail_list, image_hashes):
+        """Write the bundle's fail list and look for new files
+        Returns a record of the new files and visibly changed images"""
+
+        start = time()
+        folder = os.path.join(self.path, foldername)
 
         # Fail list, if anything failed
         if len(fail_list) > 0:
             print("[unmask] Writing fail list")
-            with open('fails.txt', 'w') as f:
+            with open(os.path.join(folder, 'fails.txt'), 'w') as f:
                 f.writelines(["%s\n" % item for item in fail_list])
 
-        self.find_new(foldername)
+        changes = self.find_new(foldername, image_hashes)
+
+        if self.store:
+            with timed('store'):
+                saved = intern_tree(self.store, folder)
+            print(f"[store] {foldername}: {saved / 2**20:.1f} MiB already stored")
+        return {
+            'bundle': foldername,
+            'new': changes['added'] + changes['modified'] if changes else [],
+            'altered': [f"{foldername}/{x}" for x in changes['altered']] if changes else [],
+            'seconds': time() - start
+        }
+
+    def find_new(self, foldername, image_hashes=None):
+        """Find new files compared to old, returns the changes if there
+        was an old folder to compare to. Remove function call if not relevant"""
 
-        os.chdir('./..')  # reset for next file
+        folder = os.path.join(self.path, foldername)
 
-    def find_new(self, foldername):
-        """Find new files compared to old
-        Remove function call if not relevant"""
+        # Manifest for this version, also used by the next one
+        print("[find_new] Hashing extracted files")
+        with timed('manifest'):
+            current = build_manifest(folder, image_hashes)
 
         # If no old folder, return
-        if foldername not in os.listdir(f'./../../{self.past}/'):
+        past_folder = os.path.join(self.past_path, foldername)
+        if foldername not in os.listdir(self.past_path):
             print(
                 f"[find_new] Couldn't find a folder {foldername} for version {self.past}"
             )
-            return
+            return None
 
-        # If old folder, get list of olds and add to dict
+        # Old folders unpacked before manifests existed are hashed once
         print("[find_new] Indexing previous version files")
-        old_files = os.listdir(f'./../../{self.past}/{foldername}')
-        existing_dict = {}
-        for old in old_files:
-            existing_dict[old.replace('-', '_')] = 1
+        previous = load_manifest(past_folder)
+        if previous is None:
+            print(f"[find_new] No manifest for version {self.past}, building one")
+            with timed('manifest'):
+                previous = build_manifest(past_folder)
+
+        with timed('diff', len(current)):
+            changes = diff_manifests(previous, current)
+            altered = altered_images(previous, current, changes['modified'], self.phash_threshold)
+        changes['altered'] = altered
+        with open(os.path.join(folder, CHANGES), 'w', encoding='utf8') as f:
+            json.dump(changes, f, ensure_ascii=False, indent=4)
+        print(
+            f"[find_new] {len(changes['added'])} added, {len(changes['modified'])} modified, "
+            f"{len(changes['removed'])} removed, {len(changes['renamed'])} renamed, "
+            f"{len(altered)} images visibly altered"
+        )
+        with timed('structdiff'):
+            self.struct_diff(foldername, changes['modified'], previous)
 
-        # Compare to new files
+        # Copy added and modified files
         print("[find_new] Copying new files")
-        for new in os.listdir('.'):
+        since = clock()
+        for new in changes['added'] + changes['modified']:
             try:
-                existing_dict[new.replace('-', '_')]
-            except KeyError:
-                try:
-                    # If new file detected, make folder and add to report dict
-                    if not os.path.exists('new'):
-                        os.mkdir('new')
-                        make_folder = True
-                    if foldername not in self.report['newfiles']:
-                        self.report['newfiles'].append(foldername)
-                    copyfile(new, f'./new/{new}')
-                except PermissionError:  # why
-                    pass
+                # If new file detected, make folder
+                dest = os.path.join(folder, 'new', new)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                copyfile(os.path.join(folder, new), dest)
+            except PermissionError:  # why
+                pass
+        record('copy', since, len(changes['added']) + len(changes['modified']))
         print('[find_new] Copied all new files to "new" directory')
 
+        return changes
+
+    def struct_diff(self, foldername, modified, previous):
+        """Write a changeset for each modified typetree JSON file
+        Unchanged files are known from the manifests, so are never loaded"""
+
+        old_paths = {path.replace('-', '_'): path for path in previous}
+        tables = [x for x in modified if '/' not in x and x.endswith('.json')]
+        if len(tables) > 0:
+            print(f"[structdiff] Diffing {len(tables)} modified data files")
+        for name in tables:
+            with open(os.path.join(self.path, foldername, name), encoding='utf8') as f:
+                new = json.load(f)
+            old_path = old_paths[name.replace('-', '_')]
+            with open(os.path.join(self.past_path, foldername, old_path), encoding='utf8') as f:
+                old = json.load(f)
+
+            changes = []
+            for op, path, values in diff_tree(old, new):
+                if op == 'change':
+                    changes.append({'op': op, 'path': list(path), 'old': values[0], 'new': values[1]})
+                else:
+                    changes.append({'op': op, 'path': list(path), 'value': values[0]})
+
+            dest = os.path.join(self.path, STRUCTDIFF, foldername)
+            os.makedirs(dest, exist_ok=True)
+            with open(os.path.join(dest, name), 'w', encoding='utf8') as f:
+                json.dump({'previous': self.past, 'changes': changes}, f, ensure_ascii=False)
+            print(f"[structdiff] {foldername}/{name}: {len(changes)} changes")
+
+    def index_tables(self, foldername):
+        """Load a bundle's decoded tables into the tables database
+        Tables already loaded for any version are only pointed at"""
+
+        folder = os.path.join(self.path, foldername)
+        manifest = load_manifest(folder) or build_manifest(folder)
+        tables = {name: entry['hash'] for name, entry in manifest.items()
+                  if '/' not in name and name.endswith(('.csv', '.json'))}
+
+        db = open_tables(self.tables)
+        loaded = 0
+        ids = {}
+        for name, digest in tables.items():
+            row = db.execute("SELECT id FROM tables WHERE hash = ?", (digest,)).fetchone()
+            if row is None:
+                # Parsed before locking, so other workers only wait on the inserts
+                rows = list(table_rows(os.path.join(folder, name)))
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor = db.execute("INSERT OR IGNORE INTO tables (hash) VALUES (?)", (digest,))
+                    if cursor.rowcount:
+                        db.executemany(
+                            "INSERT INTO rows VALUES (?, ?, ?, ?, ?)",
+                            ((cursor.lastrowid, i, field, key, data) for i, (field, key, data) in enumerate(rows))
+                        )
+                        loaded += 1
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                row = db.execute("SELECT id FROM tables WHERE hash = ?", (digest,)).fetchone()
+            ids[name] = row[0]
+
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("DELETE FROM versions WHERE version = ? AND bundle = ?", (self.current, foldername))
+        db.executemany("INSERT INTO versions VALUES (?, ?, ?, ?)",
+                       ((self.current, foldername, name, table_id) for name, table_id in ids.items()))
+        db.execute("COMMIT")
+        db.close()
+        print(f"[tables] {foldername}: {len(tables)} tables, {loaded} not indexed before")
+
     def extract_nc(self, filename):
         """Extracts and resizes "new contents" files."""
 
-        env = UnityPy.load(filename)
+        env = UnityPy.load(os.path.join(self.path, filename))
 
         # Unpack images
         for obj in env.objects:
             if obj.type.name in ['Texture2D', 'Sprite']:
                 data = obj.read()
-                dest = os.path.join(f"./NewContents",
+                dest = os.path.join(self.path, "NewContents",
                                     data.name)  # output destination
                 dest, ext = os.path.splitext(dest)
                 dest = dest + ".png"
                 img = data.image
                 # img = img.resize((1028, 512))
-                img.save(dest)
+                img.save(dest, **self.image_options)
+                if self.store:
+                    intern_file(self.store, dest)
         print(f"[unpacking] Finished resizing & unpacking {filename}")
 
-    def new_skills(self):
-        """Find new skills"""
+    def new_skills(self, chars, past_skills=None):
+        """Find new skills, chars maps hero group ids to names
+        Runs in a worker, so returns its report fields and the new skills"""
 
         # Load json into dicts
-        with open("text/HERO_SKILL.json") as f:
+        with open(os.path.join(self.path, "text/HERO_SKILL.json")) as f:
             new = json.load(f)
-        with open(f"../{self.past}/text/HERO_SKILL.json") as f:
-            old = json.load(f)
-
-        # Load and format chars.json from thanosvibs
-        url = "https://thanosvibs.money/static/data/chars.json"
-        response = requests.get(url)
-        if response.status_code == 200:
-            bytes_io = io.BytesIO(response.content)
-            json_str = bytes_io.read().decode('utf-8')
-            json_data = json.loads(json_str)
-        else:
-            print(f"Failed to retrieve chars.json: {response.status_code}")
-        chars = {str(x['id']): x['character'] for x in json_data if x['uniformed'] == 'False'}
+
+        # Without hero names, report skills by their group id
+        if not chars:
+            chars = {str(x['heroGroupId']): f"group {x['heroGroupId']}"
+                     for x in new['values'] if 'heroGroupId' in x}
 
         print("[skills] Loaded skill files into dicts")
 
-        # Variables are now lists of dicts
+        # Index new skills once, then diff every past version against them
         new = new['values']
-        old = old['values']
+        key = detect_key(new, SKILL_KEYS)
+        new_index = index_records(new, key)
+        print(f"[skills] Indexed {len(new_index)} skills by {key or 'content'}")
+
+        diffs = {}
+        for past in [self.past] + self.skill_history:
+            try:
+                if past == self.past and past_skills is not None:
+                    old = past_skills
+                else:
+                    with open(os.path.join(self.path, f"../{past}/text/HERO_SKILL.json")) as f:
+                        old = json.load(f)['values']
+            except FileNotFoundError:
+                print(f"[skills] Couldn't find skills for version {past}")
+                continue
+            # Both versions have to agree on the key, else compare by content
+            past_key = key if key and detect_key(old, (key,)) else None
+            if past_key is not None:
+                diffs[past] = diff_records(index_records(old, key), new_index)
+            else:
+                diffs[past] = diff_contents(old, new, T3TP_FIELDS)
+            diffs[past]['key'] = past_key
+            print(
+                f"[skills] {past}: {len(diffs[past]['added'])} added, "
+                f"{len(diffs[past]['modified'])} modified, {len(diffs[past]['removed'])} removed"
+            )
 
-        # Create dict from old values
-        existing = {}
-        for skill in old:
-            existing[json.dumps(skill, sort_keys=True)] = 1
-        print("[skills] Existing skill dict created")
+        # Keys become strings in JSON, so store modified skills as a list
+        with open(os.path.join(self.path, SKILLDIFF), 'w', encoding='utf8') as f:
+            json.dump({
+                past: {
+                    'key': diff['key'],
+                    'added': diff['added'],
+                    'removed': diff['removed'],
+                    'modified': [{'key': k, 'fields': v} for k, v in diff['modified'].items()]
+                } for past, diff in diffs.items()
+            }, f, ensure_ascii=False, indent=4)
 
-        # Check each new skill
-        new_skill_count = 0
+        # Report on the previous version only
+        diff = diffs.get(self.past, {'key': None, 'added': [], 'removed': [], 'modified': {}})
+        index = new_index if diff['key'] is not None else dict(enumerate(new))
+        added = set(diff['added'])
+        changed = [(k, diff['modified'].get(k)) for k in index
+                   if k in added or k in diff['modified']]
+        new_skill_count = len(changed)
         new_skill_chars = {}
         new_t3_values = []
-        for skill in new:
-            try:
-                existing[json.dumps(skill, sort_keys=True)]
-            except KeyError:
-                new_skill_count += 1
+        for k, fields in changed:
+            skill = index[k]
 
-                # Check the hero the skill belongs to
-                if 'heroGroupId' in skill.keys():
-                    try:
-                        hero = chars[str(skill['heroGroupId'])]
-                        if hero not in new_skill_chars.keys():
-                            new_skill_chars[hero] = 1
-                        else:
-                            new_skill_chars[hero] += 1
-
-                        # Check if DRX/T3 values are the only changes
-                        skill["ultimateSkillGauge"] = 0
-                        skill["dangerSkillGauge"] = 0
-                        try:
-                            existing[json.dumps(skill, sort_keys=True)]
-                            if hero not in new_t3_values:
-                                new_t3_values.append(hero)
-                        except KeyError:
-                            pass
-                    except KeyError:
-                        print(f"Unknown hero group id: {skill['heroGroupId']}")
+            # Check the hero the skill belongs to
+            if 'heroGroupId' in skill.keys():
+                try:
+                    hero = chars[str(skill['heroGroupId'])]
+                    if hero not in new_skill_chars.keys():
+                        new_skill_chars[hero] = 1
+                    else:
+                        new_skill_chars[hero] += 1
+
+                    # Check if DRX/T3 values are the only changes
+                    if fields and T3TP_FIELDS.issuperset(fields) and hero not in new_t3_values:
+                        new_t3_values.append(hero)
+                except KeyError:
+                    print(f"Unknown hero group id: {skill['heroGroupId']}")
 
         # Terminal output
         print(f"[skills] Identified {new_skill_count} new skills for {', '.join(new_skill_chars.keys())}")
         if len(new_t3_values) > 0:
             print(f"[skills] Identified {len(new_t3_values)} new T3/TP variables for {', '.join(new_t3_values)}")
 
-        # Add to report dict
-        self.report['t3tpchars'] = ', '.join(new_t3_values)
-        self.report['skillcount'] = new_skill_count
-        self.report['skillchars'] = ', '.join(new_skill_chars.keys())
+        # Fields for the report dict
+        report = {
+            't3tpchars': ', '.join(new_t3_values),
+            'skillcount': new_skill_count,
+            'skillchars': ', '.join(new_skill_chars.keys())
+        }
 
         # Generate report .txt, also determines if we re-run
         new_skill_chars = [f"{x}: {new_skill_chars[x]}" for x in new_skill_chars.keys()]
         new_skill_pairs = '\n'.join(new_skill_chars)
         text = f"NEW SKILLS: {new_skill_count}\n{new_skill_pairs}\n\nNEW T3/TP: {len(new_t3_values)}\n{', '.join(new_t3_values)}"
-        with open("_skillreport.txt", 'w', encoding='utf8') as f:
+        with open(os.path.join(self.path, "_skillreport.txt"), 'w', encoding='utf8') as f:
             f.write(text)
 
-    def compare_localisation(self):
-        """Compare localisation files"""
-        
+        return report, new
+
+    def compare_localisation(self, foldername, past_table=None):
+        """Compare one locale's strings by key, returns (locale, totals, table)
+        English keeps the plain output names, other locales get a suffix"""
+
+        locale = foldername.split('_', 1)[1]
+        name = f"{foldername}.json".lower()
+        new_folder = os.path.join(self.path, foldername)
+        old_folder = os.path.join(self.past_path, foldername)
+
         # Load json into dicts
-        with open('localization_en/Localization_en.json', encoding='utf8') as f:
-            new = json.load(f)
-        with open(f'../{self.past}/localization_en/Localization_en.json', encoding='utf8') as f:
-            old = json.load(f)
-        print("[localisation] Loaded localisation files into dicts")
-
-        # Variables are now lists of strings
-        new = new['valueTable']['values']
-        old = old['valueTable']['values']
-
-        # Create dicts
-        newdict = {}
-        olddict = {}
-        for i, string in enumerate(new):
-            newdict[string] = i
-        for i, string in enumerate(old):
-            olddict[string] = i
-        print('[localisation] Dictioraries of old and new dicts built')
-        
-        # Set operations
-        added = list(set(new) - set(old))
-        removed = list(set(old) - set(new))
-
-        # Sort by place in original dict
-        added_sorted = []
-        for string in added:
-            heapq.heappush(added_sorted, (newdict[string], string))
-        removed_sorted = []
-        for string in removed:
-            heapq.heappush(removed_sorted, (olddict[string], string))
-
-        # Add to report dict
-        self.report['added'] = len(added)
-        self.report['removed'] = len(removed)
+        try:
+            filename = next(x for x in os.listdir(new_folder) if x.lower() == name)
+            with open(os.path.join(new_folder, filename), encoding='utf8') as f:
+                new = json.load(f)
+            if past_table is not None:
+                old = {'valueTable': past_table}
+            else:
+                with open(os.path.join(old_folder, filename), encoding='utf8') as f:
+                    old = json.load(f)
+        except (StopIteration, FileNotFoundError):
+            print(f"[localisation] Couldn't find both versions of {foldername}")
+            return None
+        print(f"[localisation] Loaded {locale} localisation files into dicts")
+
+        # Pair each value with its key, dicts keep the original order
+        diff = diff_strings(new['valueTable'], old['valueTable'])
 
         # Output
-        with open("_newstrings.txt", 'w', encoding='utf8') as f:
-            while added_sorted:
-                f.write(heapq.heappop(added_sorted)[1] + "\n")
-        with open("_oldstrings.txt", 'w', encoding='utf8') as f:
-            while removed_sorted:
-                f.write(heapq.heappop(removed_sorted)[1] + "\n")
+        suffix = '' if locale == 'en' else f"_{locale}"
+        with open(os.path.join(self.path, f"_newstrings{suffix}.txt"), 'w', encoding='utf8') as f:
+            for key, string in diff['added']:
+                f.write(string + "\n")
+        with open(os.path.join(self.path, f"_oldstrings{suffix}.txt"), 'w', encoding='utf8') as f:
+            for key, string in diff['removed']:
+                f.write(string + "\n")
+        with open(os.path.join(self.path, f"_changedstrings{suffix}.txt"), 'w', encoding='utf8') as f:
+            for key, before, after in diff['modified']:
+                f.write(f"{key}\t{before}\t{after}\n")
+
+        totals = {x: len(diff[x]) for x in ('added', 'removed', 'modified')}
+        print(
+            f"[localisation] {locale}: {totals['added']} added, "
+            f"{totals['removed']} removed, {totals['modified']} modified"
+        )
+        return locale, totals, new['valueTable']
 
     def make_report(self):
         """Generate a report for the datamine job"""
@@ -428,10 +1616,34 @@ class Unpack:
             index_tracker += 1
             newfile_string = ', '.join(self.report['newfiles'])
             table_data.append(['altered bundles', ''])
+        if 'unchanged' in self.report.keys() and len(self.report['unchanged']) > 0:
+            unchanged_index = index_tracker
+            index_tracker += 1
+            unchanged_string = ', '.join(self.report['unchanged'])
+            table_data.append(['unchanged bundles', ''])
+        if 'altered' in self.report.keys() and len(self.report['altered']) > 0:
+            altered_index = index_tracker
+            index_tracker += 1
+            altered_string = ', '.join(self.report['altered'])
+            table_data.append(['altered images', ''])
+        if 'counts' in self.report.keys() and len(self.report['counts']) > 0:
+            count_index = index_tracker
+            index_tracker += 1
+            count_string = ', '.join(f"{x} {self.report['counts'][x]}" for x in sorted(self.report['counts']))
+            table_data.append(['objects', ''])
         if 'added' in self.report.keys():
-            index_tracker += 2
+            index_tracker += 3
             table_data.append(['new strings', self.report['added']])
             table_data.append(['removed strings', self.report['removed']])
+            table_data.append(['changed strings', self.report['changed']])
+        if 'locales' in self.report.keys() and len(self.report['locales']) > 0:
+            locale_index = index_tracker
+            index_tracker += 1
+            locale_string = ', '.join(
+                f"{x} +{y['added']} -{y['removed']} ~{y['modified']}"
+                for x, y in self.report['locales'].items()
+            )
+            table_data.append(['locale strings', ''])
         if 'skillcount' in self.report.keys() and self.report['skillcount'] > 0:
             skill_index = index_tracker + 1
             index_tracker += 2
@@ -453,6 +1665,18 @@ class Unpack:
             if 'newfiles' in self.report.keys() and len(self.report['newfiles']) > 0:
                 wrapped_string = '\n'.join(wrap(newfile_string, max_width))
                 table.table_data[newfile_index][1] = wrapped_string
+            if 'unchanged' in self.report.keys() and len(self.report['unchanged']) > 0:
+                wrapped_string = '\n'.join(wrap(unchanged_string, max_width))
+                table.table_data[unchanged_index][1] = wrapped_string
+            if 'altered' in self.report.keys() and len(self.report['altered']) > 0:
+                wrapped_string = '\n'.join(wrap(altered_string, max_width))
+                table.table_data[altered_index][1] = wrapped_string
+            if 'counts' in self.report.keys() and len(self.report['counts']) > 0:
+                wrapped_string = '\n'.join(wrap(count_string, max_width))
+                table.table_data[count_index][1] = wrapped_string
+            if 'locales' in self.report.keys() and len(self.report['locales']) > 0:
+                wrapped_string = '\n'.join(wrap(locale_string, max_width))
+                table.table_data[locale_index][1] = wrapped_string
             if 'skillcount' in self.report.keys() and self.report['skillcount'] > 0:
                 wrapped_string = '\n'.join(wrap(self.report['skillchars'], max_width))
                 table.table_data[skill_index][1] = wrapped_string
@@ -469,15 +1693,52 @@ class Unpack:
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('current_version', nargs=1, type=str)
-    parser.add_argument('previous_version', nargs=1, type=str)
-    parser.add_argument('format', nargs=1, type=str)
+    parser.add_argument('current_version', nargs='?', type=str)
+    parser.add_argument('previous_version', nargs='?', type=str)
+    parser.add_argument('format', nargs='?', type=str)
+    parser.add_argument('--images', choices=IMAGE_PROFILES.keys(), default='default',
+                        help="PNG encoding profile: fast, default or archive")
+    parser.add_argument('--phash-threshold', type=int, default=PHASH_THRESHOLD,
+                        help="pHash bits that must differ for an image to count as altered")
+    parser.add_argument('--skill-history', nargs='+', default=[], metavar='VERSION',
+                        help="older versions to also diff skills against, into _skilldiff.json")
+    parser.add_argument('--offline', action='store_true',
+                        help="don't fetch chars.json, use the cached copy if there is one")
+    parser.add_argument('--profile-bundle', metavar='NAME',
+                        help="write cProfile stats for every task of this bundle")
+    parser.add_argument('--batch', nargs='+', default=[], metavar='VERSION',
+                        help="later versions to datamine in order, each against the one before")
+    parser.add_argument('--store', action='store_true',
+                        help=f"hardlink extracted files into _Game Files/{STORE} by content hash")
+    parser.add_argument('--index-tables', action='store_true',
+                        help=f"load decoded tables into _Game Files/{TABLES_DB} for querying")
+    parser.add_argument('--max-chunks', type=int, metavar='N',
+                        help="most workers splitting one bundle, each loads all of it into memory")
+    parser.add_argument('--migrate-store', action='store_true',
+                        help="move every version already unpacked into the store, then exit "
+                             "unless versions are given")
     args = parser.parse_args()
-    start = time()
-    Unpack(args.current_version[0], args.previous_version[0], args.format[0])
-    end = time()
-    print(
-        Fore.GREEN + Style.BRIGHT +
-        f"Finished processing v{args.current_version[0]} in {end - start} seconds"
-    )
+
+    if args.migrate_store:
+        migrate_store("./_Game Files")
+        if args.current_version is None:
+            sys.exit()
+    if args.format is None:
+        parser.error("the following arguments are required: current_version, previous_version, format")
+
+    # Each version is indexed once, then reused as the past of the next one
+    versions = [args.previous_version, args.current_version] + args.batch
+    root = os.getcwd()
+    index = None
+    for past, current in zip(versions, versions[1:]):
+        start = time()
+        os.chdir(root)
+        index = Unpack(current, past, args.format, args.images, args.phash_threshold,
+                       args.skill_history, args.offline, args.profile_bundle, index,
+                       args.store, args.index_tables, args.max_chunks).index
+        end = time()
+        print(
+            Fore.GREEN + Style.BRIGHT +
+            f"Finished processing v{current} in {end - start} seconds"
+        )
     